@@ -21,6 +21,8 @@ Usage:
     python aurutil.py --no-cleanup                             # Don't clean up packages after building
     python aurutil.py --cleanup-only                           # Only clean up tracked packages and exit
     python aurutil.py --remote-dest user@host:path             # Check versions against remote SSH destination
+    python aurutil.py -j 4                                     # Build up to 4 outdated packages in parallel
+    python aurutil.py -j 4 -l 8                                # ...but don't start new builds above load average 8
 """
 
 import subprocess
@@ -29,6 +31,7 @@ import os
 import re
 import json
 import requests
+from requests.adapters import HTTPAdapter
 import shutil
 import argparse
 import glob
@@ -36,19 +39,99 @@ import tempfile
 import atexit
 import tomllib
 import time
+import shlex
+import sqlite3
+import graphlib
+import multiprocessing
+import functools
+import fcntl
+import platform
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 from datetime import datetime
+from urllib.parse import quote
 
-# AUR RPC API endpoint
+try:
+    # Optional: libalpm bindings (python-pyalpm) avoid spawning pacman tools
+    import pyalpm
+except ImportError:
+    pyalpm = None
+
+try:
+    # Optional: orjson parses large AUR responses several times faster than json
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# AUR RPC API info endpoint; append one "&arg[]=<name>" per package
 # Documentation: https://wiki.archlinux.org/title/AUR_web_interface#RPC_interface
-AUR_RPC_URL = "https://aur.archlinux.org/rpc/?v=5&type=info&arg[]="
+AUR_RPC_INFO_URL = "https://aur.archlinux.org/rpc/?v=5&type=info"
+# Packages per info request, keeping request URLs well below server length limits
+AUR_RPC_MAX_ARGS = 150
+
+# On-disk cache of AUR RPC results, reused across runs for AUR_CACHE_TTL seconds
+AUR_CACHE_FILE = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'aurdist' / 'aur.sqlite'
+AUR_CACHE_TTL = 600
+
+# Precompiled patterns for parsing PKGBUILDs and package filenames
+DEP_TYPES = ('depends', 'makedepends', 'checkdepends', 'optdepends')
+# PKGBUILDs are parsed as bytes; only the extracted names are decoded
+DEP_ARRAY_RE = re.compile(rf"^({'|'.join(DEP_TYPES)})=\s*\(([^)]*)\)".encode(), re.MULTILINE)
+DEP_TOKEN_RE = re.compile(rb"'([^']+)'|\"([^\"]+)\"|(\S+)")
+DEP_CONSTRAINT_RE = re.compile(r'[<>=]')
+PKGVER_RE = re.compile(r'^pkgver=[\'\"]?([^\'\"\n]+)[\'\"]?', re.MULTILINE)
+PKGREL_RE = re.compile(r'^pkgrel=[\'\"]?([^\'\"\n]+)[\'\"]?', re.MULTILINE)
+EPOCH_RE = re.compile(r'^epoch=[\'\"]?([^\'\"\n]+)[\'\"]?', re.MULTILINE)
+# Pattern: package-name-version-release-arch.pkg.tar.zst
+PKG_FILENAME_RE = re.compile(r"([^-]+(?:-[^-]+)*)-([^-]+-[^-]+)-[^-]+\.pkg\.tar\.zst")
+
+# Environment for git clones: fail instead of prompting for credentials
+# (e.g. for a mistyped or private git URL in targets.txt)
+GIT_CLONE_ENV = {"GIT_TERMINAL_PROMPT": "0"}
+
+# Pacman configuration, used to find the sync databases when pyalpm is available
+PACMAN_CONF = "/etc/pacman.conf"
+PACMAN_DB_PATH = "/var/lib/pacman"
+PACMAN_REPO_RE = re.compile(r'^\s*\[([^\]]+)\]', re.MULTILINE)
+
+# Number of packages checked concurrently when looking for outdated packages
+MAX_CHECK_WORKERS = 16
+# Number of AUR dependencies cloned concurrently
+MAX_CLONE_WORKERS = 8
+# Number of batched AUR RPC requests in flight at once
+MAX_RPC_WORKERS = 4
+# Seconds between load average checks while builds are held back by --load-average
+LOAD_CHECK_INTERVAL = 5
+
+# Shared HTTP session so AUR requests reuse keep-alive connections instead of
+# doing a fresh TCP+TLS handshake per request. The pool is sized for the
+# concurrent update checks; retries are handled by aur_rpc_request_with_retry.
+aur_session = requests.Session()
+aur_session.mount("https://", HTTPAdapter(pool_connections=MAX_CHECK_WORKERS, pool_maxsize=MAX_CHECK_WORKERS * 2))
+aur_session.headers["User-Agent"] = "aurdist/1.0 (+https://github.com/SomethingGeneric/aurdist)"
 
 # Global tracking for cleanup
 cloned_directories = set()
 build_failures = []
 installed_packages = set()  # Track packages installed during build process
 root_directory = None  # Track the root directory for AUR package building
+build_directory = None  # Per-run directory packages are cloned and built in
 aur_connectivity_errors = []  # Track AUR connectivity failures
+pending_repo_packages = []  # Package files copied to packages/ that aren't in the repository database yet
+
+# Repository lookups made during this run, so dependencies shared between packages are only queried once
+official_repo_lookups = {}  # Package name -> whether it is in the official repositories
+aur_info_lookups = {}  # Package name -> AUR info, or None if it isn't in the AUR
+aur_cache_enabled = True  # Whether AUR info may be read from the on-disk cache
+build_env = {}  # Extra environment variables for makepkg builds
+
+# Shared SSH connections, reused by ssh and rsync calls to the same host
+ssh_masters = {}  # SSH target -> ssh master process
+ssh_control_path = None  # ControlPath of the shared connections, once one was opened
+
+# Serializes pacman transactions and writes to packages/ when building with --jobs > 1
+pacman_lock = multiprocessing.Lock()
 
 def aur_rpc_request_with_retry(url, max_retries=5, initial_backoff=1):
     """Make an AUR RPC request with exponential backoff retry logic.
@@ -63,7 +146,7 @@ def aur_rpc_request_with_retry(url, max_retries=5, initial_backoff=1):
     """
     for attempt in range(max_retries):
         try:
-            response = requests.get(url, timeout=10)
+            response = aur_session.get(url, timeout=10)
             if response.status_code == 200:
                 return response
             else:
@@ -97,8 +180,13 @@ def aur_rpc_request_with_retry(url, max_retries=5, initial_backoff=1):
     
     return None
 
+@functools.lru_cache(maxsize=1)
 def load_ssh_config():
-    """Load SSH configuration from ssh.toml file."""
+    """Load SSH configuration from ssh.toml file.
+    
+    The file is read once per run; the returned dict is shared between callers
+    and must not be modified.
+    """
     ssh_config_file = Path("ssh.toml")
     if not ssh_config_file.exists():
         # Return default config if file doesn't exist
@@ -152,18 +240,97 @@ def build_ssh_command_args(ssh_config):
     if ssh_config.get('server_alive_interval'):
         args.extend(['-o', f"ServerAliveInterval={ssh_config['server_alive_interval']}"])
     
+    # Reuse a shared connection to the host if start_ssh_master opened one;
+    # without one, ssh connects directly as usual
+    if ssh_control_path:
+        args.extend(['-o', f"ControlPath={ssh_control_path}", '-o', 'ControlMaster=no'])
+    
     return args
 
-def cleanup_cloned_directories():
-    """Clean up all cloned AUR directories."""
-    for directory in cloned_directories.copy():
-        if os.path.exists(directory):
+def start_ssh_master(remote_dest):
+    """Open a shared SSH connection to a remote destination's host.
+    
+    Later ssh and rsync calls to the same host run over this connection instead
+    of each doing their own TCP handshake and authentication. The master runs
+    in the foreground of a child process with its output discarded (rather than
+    via ControlPersist, which would keep our output pipes open after exit) and
+    is closed by stop_ssh_masters at exit. Calls for a host that already has a
+    master, or for local destinations, do nothing.
+    
+    Args:
+        remote_dest: Destination as user@host:path; overridden by the user in ssh.toml
+    """
+    global ssh_control_path
+    
+    ssh_config = load_ssh_config()
+    if ssh_config.get('user'):
+        remote_dest = ssh_config['user']
+    
+    # Like rsync, treat the destination as remote if a ':' comes before any '/'
+    host_part = remote_dest.split('/', 1)[0]
+    if ':' not in host_part:
+        return
+    ssh_target = host_part.split(':', 1)[0]
+    if ssh_target in ssh_masters:
+        return
+    
+    # %C is a hash of the host, port and user, so each host gets its own socket
+    control_path = ssh_control_path or os.path.join(tempfile.gettempdir(), f"aurdist-{os.getpid()}-%C")
+    # ssh uses the first value given for an option, so the master options come first
+    master_cmd = [
+        "ssh", '-o', f"ControlPath={control_path}", '-o', 'ControlMaster=yes', '-o', 'ControlPersist=no',
+        *build_ssh_command_args(ssh_config), '-o', 'BatchMode=yes', '-o', 'ServerAliveInterval=60', '-N', ssh_target,
+    ]
+    try:
+        ssh_masters[ssh_target] = subprocess.Popen(master_cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError as e:
+        print(f"Warning: Could not open a shared SSH connection to {ssh_target}: {e}")
+        return
+    
+    if ssh_control_path is None:
+        ssh_control_path = control_path
+        atexit.register(stop_ssh_masters)
+
+def stop_ssh_masters():
+    """Close the shared SSH connections opened by start_ssh_master."""
+    for process in ssh_masters.values():
+        if process.poll() is None:
+            process.terminate()
             try:
-                print(f"Cleaning up directory: {directory}")
-                shutil.rmtree(directory)
-                cloned_directories.discard(directory)
-            except Exception as e:
-                print(f"Warning: Failed to clean up {directory}: {e}")
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    ssh_masters.clear()
+
+def cleanup_cloned_directories():
+    """Clean up all cloned AUR directories.
+    
+    Every clone lives in the build directory, so they are all removed at
+    once along with it. Runs both at the end of main() and at exit; once the
+    build directory is gone there is nothing left to do.
+    """
+    if build_directory and os.path.exists(build_directory):
+        try:
+            print(f"Cleaning up {len(cloned_directories)} cloned directories in {build_directory}")
+            remove_directory(build_directory)
+        except OSError as e:
+            print(f"Warning: Failed to clean up {build_directory}: {e}")
+            return
+    
+    cloned_directories.clear()
+
+def remove_directory(path):
+    """Remove a directory tree.
+    
+    Uses `rm -rf`, which removes git clones with thousands of small object files
+    much faster than walking them in Python. Falls back to shutil.rmtree if rm fails.
+    
+    Args:
+        path: Directory to remove
+    """
+    result = run_process(["rm", "-rf", "--", path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if result.returncode != 0:
+        shutil.rmtree(path)
 
 def cleanup_installed_packages():
     """Clean up packages installed during the build process."""
@@ -176,29 +343,45 @@ def cleanup_installed_packages():
     packages_to_remove = list(installed_packages)
     
     # Remove packages in batches to avoid command line length limits
-    batch_size = 50
+    batch_size = 500
     for i in range(0, len(packages_to_remove), batch_size):
         batch = packages_to_remove[i:i + batch_size]
         print(f"Removing packages batch {i//batch_size + 1}: {', '.join(batch[:5])}{'...' if len(batch) > 5 else ''}")
         
-        try:
-            # Use pacman to remove packages
-            run_command(f"sudo pacman -R --noconfirm {' '.join(batch)}", check=False)
-            print(f"Successfully removed {len(batch)} packages")
-        except Exception as e:
-            print(f"Warning: Failed to remove some packages: {e}")
-            # Try removing packages individually
-            for package in batch:
-                try:
-                    run_command(f"sudo pacman -R --noconfirm {package}", check=False)
-                    print(f"Removed {package}")
-                except Exception as e:
-                    print(f"Warning: Failed to remove {package}: {e}")
+        removed = remove_packages(batch)
+        print(f"Successfully removed {removed} of {len(batch)} packages")
     
     # Clear the tracking set
     installed_packages.clear()
     print("Package cleanup completed")
 
+def remove_packages(packages):
+    """Remove packages with pacman, using as few pacman calls as possible.
+    
+    If removing a batch fails (e.g. one package is still required by another),
+    the batch is split in half and each half is retried, so a few failing
+    packages cost a logarithmic number of extra calls instead of one per package.
+    
+    Args:
+        packages: List of package names to remove
+        
+    Returns:
+        Number of packages removed
+    """
+    if not packages:
+        return 0
+    
+    result = run_process(["sudo", "pacman", "-R", "--noconfirm", *packages], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode == 0:
+        return len(packages)
+    
+    if len(packages) == 1:
+        print(f"Warning: Failed to remove {packages[0]}: {result.stderr.strip()}")
+        return 0
+    
+    middle = len(packages) // 2
+    return remove_packages(packages[:middle]) + remove_packages(packages[middle:])
+
 def track_package_installation(package_name):
     """Track a package that was installed during the build process."""
     installed_packages.add(package_name)
@@ -208,6 +391,23 @@ def set_root_directory():
     global root_directory
     root_directory = os.getcwd()
 
+def disable_aur_cache():
+    """Always fetch AUR info from the AUR instead of the on-disk cache for this run."""
+    global aur_cache_enabled
+    aur_cache_enabled = False
+
+def set_build_parallelism(concurrent_builds):
+    """Split the CPUs between concurrent builds through makepkg's MAKEFLAGS.
+    
+    Each build gets an equal share of the CPUs as make jobs. A MAKEFLAGS
+    already set in the environment (or in makepkg.conf) takes precedence.
+    
+    Args:
+        concurrent_builds: Number of packages built at the same time
+    """
+    if "MAKEFLAGS" not in os.environ:
+        build_env["MAKEFLAGS"] = f"-j{max(1, (os.cpu_count() or 1) // concurrent_builds)}"
+
 def get_root_directory():
     """Get the root directory for AUR package building."""
     global root_directory
@@ -215,18 +415,17 @@ def get_root_directory():
         root_directory = os.getcwd()
     return root_directory
 
-def ensure_root_directory():
-    """Ensure we're in the root directory for AUR package building."""
-    root_dir = get_root_directory()
-    if os.getcwd() != root_dir:
-        os.chdir(root_dir)
-
-def get_installed_packages():
-    """Get list of currently installed packages from pacman."""
-    stdout, stderr = run_command("pacman -Qq", check=False)
-    if stdout:
-        return set(stdout.split('\n'))
-    return set()
+def get_build_directory():
+    """Get the directory packages are cloned and built in, creating it on first use.
+    
+    Each run gets a fresh directory, so clones never collide with files in the
+    root directory or with leftovers of an interrupted run. It is created under
+    the root directory rather than /tmp, which is often a small tmpfs.
+    """
+    global build_directory
+    if build_directory is None:
+        build_directory = tempfile.mkdtemp(prefix=".aurdist-build-", dir=get_root_directory())
+    return build_directory
 
 def manual_cleanup():
     """Manually clean up packages that were tracked during build process."""
@@ -346,136 +545,288 @@ def extract_package_name_from_git_url(git_url):
 def safe_clone_aur_package(package_name, debug=False, git_url=None):
     """Safely clone an AUR package or generic git repository, removing existing directory if it exists.
     
+    A directory already cloned during this run is reused instead of being
+    cloned again, e.g. when a package is built and later installed as a
+    dependency of another package.
+    
     Args:
         package_name: Name of the package (used as directory name)
         debug: Enable debug output
         git_url: Optional git URL. If provided, clone from this URL instead of AUR
+        
+    Returns:
+        Path of the cloned directory (package_name under the build directory)
     """
+    pkg_dir = os.path.join(get_build_directory(), package_name)
+    
+    # Reuse the working copy if this run already cloned it
+    if pkg_dir in cloned_directories and os.path.exists(os.path.join(pkg_dir, "PKGBUILD")):
+        if debug:
+            print(f"DEBUG: Reusing existing clone of {package_name}")
+        return pkg_dir
+    
     # Remove existing directory if it exists
-    if os.path.exists(package_name):
+    if os.path.exists(pkg_dir):
         print(f"Removing existing directory: {package_name}")
         try:
-            shutil.rmtree(package_name)
+            remove_directory(pkg_dir)
         except Exception as e:
             print(f"Warning: Failed to remove existing directory {package_name}: {e}")
     
-    # Clone the repository
+    # Clone the repository. Only the current PKGBUILD tree is needed, so skip the history.
     if git_url:
         # Clone from provided git URL
-        clone_cmd = f"git clone {git_url} {package_name}"
+        clone_cmd = ["git", "clone", "--depth=1", "--single-branch", git_url, pkg_dir]
         print(f"Cloning from generic git URL: {git_url}")
     else:
         # Clone from AUR
-        clone_cmd = f"git clone https://aur.archlinux.org/{package_name}.git"
+        clone_cmd = ["git", "clone", "--depth=1", "--single-branch", f"https://aur.archlinux.org/{package_name}.git", pkg_dir]
     
-    run_command(clone_cmd, package_name=package_name, debug=debug)
+    run_command(clone_cmd, package_name=package_name, debug=debug, env=GIT_CLONE_ENV, discard_stdout=True)
     
     # Register for cleanup
-    cloned_directories.add(package_name)
+    cloned_directories.add(pkg_dir)
     
-    return package_name
+    return pkg_dir
 
-def run_command(command, check=True, capture_output=True, cwd=None, package_name=None, debug=False):
-    """Run a shell command and return the output."""
-    if debug and not capture_output:
-        # In debug mode, show output in real-time
-        print(f"DEBUG: Running command: {command}")
-        if cwd:
-            print(f"DEBUG: In directory: {cwd}")
-        result = subprocess.run(command, shell=True, cwd=cwd)
-        if result.returncode != 0:
-            error_msg = f"Command failed: '{command}' (exit code: {result.returncode})"
-            if cwd:
-                error_msg += f" in directory: {cwd}"
-            
-            if package_name:
-                build_failures.append({
-                    'package': package_name,
-                    'command': command,
-                    'error': error_msg,
-                    'timestamp': datetime.now().isoformat()
-                })
-                print(f"BUILD FAILURE for {package_name}: {error_msg}")
-            else:
-                print(f"Error running command '{command}'")
-            
-            if check:
-                sys.exit(result.returncode)
-        return "", ""
-    elif capture_output:
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, shell=True, cwd=cwd)
-        if result.returncode != 0:
-            error_msg = f"Command failed: '{command}' (exit code: {result.returncode})"
-            if cwd:
-                error_msg += f" in directory: {cwd}"
-            if result.stderr:
-                error_msg += f"\nStderr: {result.stderr}"
-            if result.stdout:
-                error_msg += f"\nStdout: {result.stdout}"
-            
-            if package_name:
-                build_failures.append({
-                    'package': package_name,
-                    'command': command,
-                    'error': error_msg,
-                    'timestamp': datetime.now().isoformat()
-                })
-                print(f"BUILD FAILURE for {package_name}: {error_msg}")
-            else:
-                print(f"Error running command '{command}': {result.stderr}")
-            
-            if check:
-                sys.exit(result.returncode)
-        return result.stdout.strip(), result.stderr.strip()
+def run_process(command, **kwargs):
+    """Run a command with subprocess.run, reporting a missing executable as exit code 127 like a shell would."""
+    try:
+        return subprocess.run(command, **kwargs)
+    except FileNotFoundError:
+        return subprocess.CompletedProcess(command, 127, stdout='', stderr=f"{command[0]}: command not found")
+
+def run_command(command, check=True, capture_output=True, cwd=None, package_name=None, debug=False, env=None, discard_stdout=False):
+    """Run a command and return the output.
+    
+    The command is an argv list and is executed directly, without a shell.
+    env holds extra environment variables for the command, on top of ours.
+    With discard_stdout, stdout isn't read at all (only stderr is captured),
+    for commands whose output is ignored.
+    """
+    command_str = shlex.join(command)
+    if env:
+        env = {**os.environ, **env}
+    
+    if capture_output:
+        stdout = subprocess.DEVNULL if discard_stdout else subprocess.PIPE
+        result = run_process(command, stdout=stdout, stderr=subprocess.PIPE, text=True, cwd=cwd, env=env)
     else:
-        result = subprocess.run(command, shell=True, cwd=cwd)
-        if result.returncode != 0:
-            error_msg = f"Command failed: '{command}' (exit code: {result.returncode})"
+        if debug:
+            # In debug mode, show output in real-time
+            print(f"DEBUG: Running command: {command_str}")
             if cwd:
-                error_msg += f" in directory: {cwd}"
-            
-            if package_name:
-                build_failures.append({
-                    'package': package_name,
-                    'command': command,
-                    'error': error_msg,
-                    'timestamp': datetime.now().isoformat()
-                })
-                print(f"BUILD FAILURE for {package_name}: {error_msg}")
-            else:
-                print(f"Error running command '{command}'")
-            
-            if check:
-                sys.exit(result.returncode)
-        return "", ""
-
-def is_package_in_official_repos(package_name):
-    """Check if a package is in the official repositories using pacman."""
-    stdout, stderr = run_command(f"pacman -Si {package_name}", check=False)
-    return stdout and "Repository" in stdout
-
-def is_package_in_aur(package_name):
-    """Check if a package exists in the AUR using the RPC interface."""
-    response = aur_rpc_request_with_retry(f"{AUR_RPC_URL}{package_name}")
-    if response:
-        try:
-            data = response.json()
-            return data.get("resultcount", 0) > 0
-        except json.JSONDecodeError as e:
-            print(f"Error parsing JSON response for {package_name}: {e}")
-    return False
+                print(f"DEBUG: In directory: {cwd}")
+        result = run_process(command, cwd=cwd, env=env)
+    
+    if result.returncode != 0:
+        report_command_failure(command_str, result, cwd=cwd, package_name=package_name)
+        if check:
+            sys.exit(result.returncode)
+    
+    return (result.stdout or "").strip(), (result.stderr or "").strip()
+
+def report_command_failure(command_str, result, cwd=None, package_name=None):
+    """Report a failed command, recording it as a build failure if it was run for a package.
+    
+    Args:
+        command_str: The command as a shell-quoted string
+        result: CompletedProcess of the command; captured output is included in the report
+        cwd: Directory the command ran in
+        package_name: Package the command was run for, if any
+    """
+    error_msg = f"Command failed: '{command_str}' (exit code: {result.returncode})"
+    if cwd:
+        error_msg += f" in directory: {cwd}"
+    if result.stderr:
+        error_msg += f"\nStderr: {result.stderr}"
+    if result.stdout:
+        error_msg += f"\nStdout: {result.stdout}"
+    
+    if package_name:
+        build_failures.append({
+            'package': package_name,
+            'command': command_str,
+            'error': error_msg,
+            'timestamp': datetime.now().isoformat()
+        })
+        print(f"BUILD FAILURE for {package_name}: {error_msg}")
+    elif result.stderr is not None:
+        print(f"Error running command '{command_str}': {result.stderr}")
+    else:
+        print(f"Error running command '{command_str}'")
+
+@functools.lru_cache(maxsize=1)
+def get_alpm_sync_dbs():
+    """Open the pacman sync databases in-process with pyalpm.
+    
+    Returns:
+        List of pyalpm sync databases, or None if pyalpm isn't available or
+        the databases couldn't be opened
+    """
+    if not pyalpm:
+        return None
+    
+    try:
+        with open(PACMAN_CONF) as f:
+            repos = [repo for repo in PACMAN_REPO_RE.findall(f.read()) if repo != 'options']
+        handle = pyalpm.Handle("/", PACMAN_DB_PATH)
+        return [handle.register_syncdb(repo, pyalpm.SIG_DATABASE_OPTIONAL) for repo in repos]
+    except (OSError, pyalpm.error) as e:
+        print(f"Warning: Could not open sync databases with pyalpm, falling back to pacman: {e}")
+        return None
+
+@functools.lru_cache(maxsize=1)
+def get_official_repo_names():
+    """List every package in the sync databases with a single `pacman -Slq`.
+    
+    Returns:
+        Frozenset of package names
+    """
+    stdout, stderr = run_command(["pacman", "-Slq"], check=False)
+    return frozenset(stdout.split())
+
+def refresh_repo_lookups():
+    """Forget official repository lookups after the sync databases were refreshed.
+    
+    Call this after `pacman -Sy`, so packages built and synced earlier in this
+    run are found in the aurdist repository by later lookups.
+    """
+    official_repo_lookups.clear()
+    get_official_repo_names.cache_clear()
+    get_alpm_sync_dbs.cache_clear()
+
+def get_official_repo_packages(package_names):
+    """Find which of the given packages are in the official repositories.
+    
+    Looks the packages up in the sync databases with pyalpm if available,
+    otherwise in the package list from get_official_repo_names(). Packages
+    looked up earlier in this run aren't looked up again.
+    
+    Args:
+        package_names: Iterable of package names to look up
+        
+    Returns:
+        Set of package names that pacman reported as available
+    """
+    names = [name for name in package_names if name]
+    unknown = [name for name in dict.fromkeys(names) if name not in official_repo_lookups]
+    
+    sync_dbs = get_alpm_sync_dbs() if unknown else None
+    if sync_dbs is not None:
+        for name in unknown:
+            official_repo_lookups[name] = any(db.get_pkg(name) for db in sync_dbs)
+    elif unknown:
+        repo_names = get_official_repo_names()
+        for name in unknown:
+            official_repo_lookups[name] = name in repo_names
+    
+    return {name for name in names if official_repo_lookups[name]}
 
 def get_aur_package_info(package_name):
     """Get detailed information about an AUR package."""
-    response = aur_rpc_request_with_retry(f"{AUR_RPC_URL}{package_name}")
-    if response:
+    return get_aur_package_infos([package_name]).get(package_name)
+
+def open_aur_cache():
+    """Open the on-disk AUR info cache, creating it if needed."""
+    AUR_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(AUR_CACHE_FILE, timeout=30)
+    connection.execute("CREATE TABLE IF NOT EXISTS aur_info (name TEXT PRIMARY KEY, fetched_at INTEGER, json TEXT)")
+    return connection
+
+def aur_cache_get(package_names):
+    """Get cached AUR info for packages fetched less than AUR_CACHE_TTL seconds ago.
+    
+    Args:
+        package_names: List of package names to look up
+        
+    Returns:
+        Dict mapping package name to its cached AUR info; stale or missing entries are omitted
+    """
+    if not package_names or not aur_cache_enabled:
+        return {}
+    
+    try:
+        connection = open_aur_cache()
         try:
-            data = response.json()
-            if data.get("resultcount", 0) > 0:
-                return data["results"][0]
-        except json.JSONDecodeError as e:
-            print(f"Error parsing JSON response for {package_name}: {e}")
-    return None
+            placeholders = ','.join('?' * len(package_names))
+            rows = connection.execute(
+                f"SELECT name, json FROM aur_info WHERE fetched_at > ? AND name IN ({placeholders})",
+                [int(time.time()) - AUR_CACHE_TTL, *package_names]
+            ).fetchall()
+        finally:
+            connection.close()
+        return {name: json_loads(info) for name, info in rows}
+    except (sqlite3.Error, OSError, json.JSONDecodeError) as e:
+        print(f"Warning: Error reading AUR cache {AUR_CACHE_FILE}: {e}")
+        return {}
+
+def aur_cache_put(infos):
+    """Store AUR info results in the on-disk cache.
+    
+    Args:
+        infos: Dict mapping package name to its AUR info
+    """
+    if not infos:
+        return
+    
+    try:
+        connection = open_aur_cache()
+        try:
+            with connection:
+                now = int(time.time())
+                connection.executemany(
+                    "INSERT OR REPLACE INTO aur_info (name, fetched_at, json) VALUES (?, ?, ?)",
+                    [(name, now, json.dumps(info)) for name, info in infos.items()]
+                )
+        finally:
+            connection.close()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Warning: Error writing AUR cache {AUR_CACHE_FILE}: {e}")
+
+def get_aur_package_infos(package_names):
+    """Get detailed information about several AUR packages with batched RPC requests.
+    
+    Up to AUR_RPC_MAX_ARGS packages are requested at once, with several such
+    requests in flight concurrently. Packages already looked up during this
+    run, or fetched recently enough to be in the on-disk cache, are not
+    requested from the AUR again.
+    
+    Args:
+        package_names: Iterable of package names to look up
+        
+    Returns:
+        Dict mapping package name to its AUR info; packages not in the AUR are omitted
+    """
+    names = [name for name in dict.fromkeys(package_names) if name]
+    
+    unknown = [name for name in names if name not in aur_info_lookups]
+    cached = aur_cache_get(unknown)
+    aur_info_lookups.update(cached)
+    
+    missing = [name for name in unknown if name not in cached]
+    batches = [missing[start:start + AUR_RPC_MAX_ARGS] for start in range(0, len(missing), AUR_RPC_MAX_ARGS)]
+    urls = [AUR_RPC_INFO_URL + ''.join(f"&arg[]={quote(name)}" for name in batch) for batch in batches]
+    if len(urls) > 1:
+        # Send the batches concurrently over the shared session's connection pool
+        with ThreadPoolExecutor(max_workers=min(MAX_RPC_WORKERS, len(urls))) as executor:
+            responses = list(executor.map(aur_rpc_request_with_retry, urls))
+    else:
+        responses = [aur_rpc_request_with_retry(url) for url in urls]
+    
+    for batch, response in zip(batches, responses):
+        if response:
+            try:
+                data = json_loads(response.content)
+                fetched = {result['Name']: result for result in data.get("results", [])}
+                aur_cache_put(fetched)
+                # Only remember packages as missing from the AUR if the request succeeded
+                for name in batch:
+                    aur_info_lookups[name] = fetched.get(name)
+            except json.JSONDecodeError as e:
+                print(f"Error parsing JSON response for {len(batch)} packages: {e}")
+    
+    return {name: aur_info_lookups[name] for name in names if aur_info_lookups.get(name) is not None}
 
 def get_aur_version(package_name):
     """Get the latest version of a package from the AUR."""
@@ -484,35 +835,134 @@ def get_aur_version(package_name):
         return package_info.get('Version', '0')
     return '0'
 
-def get_local_version(package_name):
-    """Get the version of the locally built package."""
-    packages_dir = Path("packages")
-    if not packages_dir.exists():
-        return '0'
+@functools.lru_cache(maxsize=None)
+def package_version_re(package_name):
+    """Get the compiled pattern that extracts the version from a package filename of package_name."""
+    return re.compile(rf"{re.escape(package_name)}(?:-[a-zA-Z0-9]+)?-(.+)-[^-]+\.pkg\.tar\.zst")
+
+@functools.lru_cache(maxsize=None)
+def vercmp(version_a, version_b):
+    """Compare two package versions using pacman's version comparison rules.
     
-    # Look for package files matching the pattern
-    pattern = f"{package_name}-*.pkg.tar.zst"
-    pkg_files = list(packages_dir.glob(pattern))
+    Uses pyalpm if available, otherwise the vercmp tool shipped with pacman.
     
-    if not pkg_files:
-        return '0'
+    Returns:
+        Negative if version_a is older than version_b, 0 if they are equal,
+        positive if version_a is newer
+    """
+    if version_a == version_b:
+        return 0
+    if pyalpm:
+        return pyalpm.vercmp(version_a, version_b)
     
-    # Get the most recent file
-    pkg_file = max(pkg_files, key=os.path.getctime)
+    stdout, stderr = run_command(["vercmp", version_a, version_b], check=False)
+    try:
+        return int(stdout)
+    except ValueError:
+        # vercmp isn't available; treat different versions as outdated
+        return -1
+
+@functools.lru_cache(maxsize=1)
+def scan_packages_dir():
+    """List the built package files in packages/ with a single directory scan.
     
-    # Extract version from filename
-    # Pattern: package-name-version-release-arch.pkg.tar.zst
-    match = re.match(rf"{re.escape(package_name)}(?:-[a-zA-Z0-9]+)?-(.+)-[^-]+\.pkg\.tar\.zst", pkg_file.name)
-    if match:
-        return match.group(1)
+    The result is cached; call refresh_packages_dir() after adding packages.
     
-    return '0'
+    Returns:
+        Tuple of package filenames, empty if packages/ doesn't exist
+    """
+    try:
+        with os.scandir(os.path.join(get_root_directory(), "packages")) as entries:
+            return tuple(
+                entry.name
+                for entry in entries
+                if entry.name.endswith('.pkg.tar.zst') and entry.is_file()
+            )
+    except FileNotFoundError:
+        return ()
 
-def get_remote_version(package_name, remote_dest):
-    """Get the version of a package from a remote SSH destination."""
-    if not remote_dest:
+def index_package_files(filenames):
+    """Map every package among the given package filenames to its newest version.
+    
+    Args:
+        filenames: Iterable of package filenames
+        
+    Returns:
+        Dict mapping package name to version (pkgver-pkgrel, with epoch if any)
+    """
+    index = {}
+    for filename in filenames:
+        # Pattern: package-name-version-release-arch.pkg.tar.zst
+        match = PKG_FILENAME_RE.match(filename)
+        if match:
+            name, version = match.groups()
+            if name not in index or vercmp(version, index[name]) > 0:
+                index[name] = version
+    return index
+
+def find_package_version(package_name, filenames, index):
+    """Get the newest version of a package among package filenames.
+    
+    Args:
+        package_name: Name of the package
+        filenames: Package filenames to search
+        index: Index of the same filenames from index_package_files
+        
+    Returns:
+        Version string, or '0' if there is no file for the package
+    """
+    version = index.get(package_name)
+    if version:
+        return version
+    
+    # Fall back to files whose package name carries an extra suffix
+    prefix = f"{package_name}-"
+    version_re = package_version_re(package_name)
+    versions = [
+        match.group(1)
+        for match in (version_re.match(filename) for filename in filenames if filename.startswith(prefix))
+        if match
+    ]
+    
+    if not versions:
         return '0'
     
+    # Get the newest version, ordered like pacman orders them
+    return max(versions, key=functools.cmp_to_key(vercmp))
+
+@functools.lru_cache(maxsize=1)
+def local_package_index():
+    """Map every package in packages/ to its newest built version.
+    
+    Built from the cached directory scan; call refresh_packages_dir() after adding packages.
+    
+    Returns:
+        Dict mapping package name to version (pkgver-pkgrel, with epoch if any)
+    """
+    return index_package_files(scan_packages_dir())
+
+def refresh_packages_dir():
+    """Drop the cached listing of packages/ after package files were added or removed."""
+    scan_packages_dir.cache_clear()
+    local_package_index.cache_clear()
+
+def get_local_version(package_name):
+    """Get the version of the locally built package."""
+    return find_package_version(package_name, scan_packages_dir(), local_package_index())
+
+@functools.lru_cache(maxsize=None)
+def list_remote_packages(remote_dest):
+    """List the package files at a remote SSH destination with a single SSH call.
+    
+    The result is cached, so checking many packages against the same
+    destination costs one connection instead of one per package.
+    
+    Args:
+        remote_dest: SSH destination (user@host:path)
+        
+    Returns:
+        Tuple of package filenames, empty if the listing failed
+    """
     try:
         # Load SSH configuration
         ssh_config = load_ssh_config()
@@ -530,84 +980,115 @@ def get_remote_version(package_name, remote_dest):
             remote_path = '.'
         
         # Build SSH command with configuration
-        ssh_args = build_ssh_command_args(ssh_config)
-        ssh_args_str = ' '.join(ssh_args) if ssh_args else '-o StrictHostKeyChecking=no'
+        ssh_args = build_ssh_command_args(ssh_config) or ['-o', 'StrictHostKeyChecking=no']
         
-        # Use SSH to list package files matching the pattern on the remote host
-        pattern = f"{package_name}-*.pkg.tar.zst"
-        ssh_command = f"ssh {ssh_args_str} {ssh_target} 'cd {remote_path} && ls -1t {pattern} 2>/dev/null | head -1'"
+        # Use SSH to list the package files on the remote host
+        # (the remote command is still run by the remote shell, so quote its arguments)
+        ssh_command = ["ssh", *ssh_args, ssh_target, f"cd {shlex.quote(remote_path)} && ls -1"]
         
         stdout, stderr = run_command(ssh_command, check=False)
-        
-        if not stdout.strip():
-            return '0'
-        
-        # Extract the most recent package filename
-        pkg_filename = stdout.strip().split('\n')[0]
-        if not pkg_filename:
-            return '0'
-        
-        # Extract version from filename (same pattern as local version)
-        # Pattern: package-name-version-release-arch.pkg.tar.zst
-        match = re.match(rf"{re.escape(package_name)}(?:-[a-zA-Z0-9]+)?-(.+)-[^-]+\.pkg\.tar\.zst", pkg_filename)
-        if match:
-            return match.group(1)
-            
+        return tuple(line for line in stdout.split('\n') if line.endswith('.pkg.tar.zst'))
+    
     except Exception as e:
-        print(f"Error checking remote version for {package_name}: {e}")
+        print(f"Error listing remote packages at {remote_dest}: {e}")
+        return ()
+
+@functools.lru_cache(maxsize=None)
+def remote_package_index(remote_dest):
+    """Map every package at a remote SSH destination to its newest version."""
+    return index_package_files(list_remote_packages(remote_dest))
+
+def get_remote_version(package_name, remote_dest):
+    """Get the version of a package from a remote SSH destination."""
+    if not remote_dest:
+        return '0'
     
-    return '0'
+    return find_package_version(package_name, list_remote_packages(remote_dest), remote_package_index(remote_dest))
 
 def parse_pkgbuild_dependencies(pkgbuild_path):
-    """Parse PKGBUILD file to extract dependencies."""
-    dependencies = {
-        'depends': [],
-        'makedepends': [],
-        'checkdepends': [],
-        'optdepends': []
-    }
+    """Parse PKGBUILD file to extract dependencies.
     
+    The PKGBUILD is evaluated by bash through `makepkg --printsrcinfo`, which
+    handles quoting, comments, variable expansion and architecture-specific
+    arrays. If makepkg can't be used (e.g. not on Arch Linux or running as
+    root), the arrays are extracted with regular expressions instead.
+    """
     if not os.path.exists(pkgbuild_path):
-        return dependencies
+        return {dep_type: [] for dep_type in DEP_TYPES}
+    
+    dependencies = parse_srcinfo_dependencies(pkgbuild_path)
+    if dependencies is None:
+        dependencies = parse_pkgbuild_dependencies_regex(pkgbuild_path)
+    return dependencies
+
+def parse_srcinfo_dependencies(pkgbuild_path):
+    """Extract dependencies from the .SRCINFO generated by `makepkg --printsrcinfo`.
     
-    with open(pkgbuild_path, 'r', encoding='utf-8') as f:
+    Returns:
+        Dict of dependency lists, or None if makepkg failed
+    """
+    result = run_process(["makepkg", "--printsrcinfo", "-p", os.path.basename(pkgbuild_path)],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                         cwd=os.path.dirname(pkgbuild_path) or None)
+    if result.returncode != 0:
+        return None
+    
+    dependencies = {dep_type: [] for dep_type in DEP_TYPES}
+    arch_suffix = f"_{platform.machine()}"
+    
+    # Lines look like "\tdepends = foo>=1.0"; split packages repeat keys per package
+    for line in result.stdout.split('\n'):
+        key, sep, value = line.strip().partition(' = ')
+        if not sep:
+            continue
+        if key.endswith(arch_suffix):
+            key = key[:-len(arch_suffix)]
+        if key not in dependencies:
+            continue
+        if key == 'optdepends':
+            # Format: "package: description" or just "package"
+            value = value.split(':')[0].strip()
+        if value and value not in dependencies[key]:
+            dependencies[key].append(value)
+    
+    return dependencies
+
+def parse_pkgbuild_dependencies_regex(pkgbuild_path):
+    """Extract dependency arrays from a PKGBUILD with regular expressions."""
+    dependencies = {dep_type: [] for dep_type in DEP_TYPES}
+    
+    with open(pkgbuild_path, 'rb') as f:
         content = f.read()
     
-    # Extract dependencies using regex
-    for dep_type in dependencies.keys():
-        # Use a more specific pattern that matches the exact dependency type
-        pattern = rf"^{dep_type}=\s*\((.*?)\)"
-        matches = re.findall(pattern, content, re.MULTILINE | re.DOTALL)
-        if matches:
-            # Split by newlines and clean up
-            deps = []
-            for match in matches:
-                lines = match.split('\n')
-                for line in lines:
-                    line = line.strip()
-                    if line and not line.startswith('#'):
-                        if dep_type == 'optdepends':
-                            # For optional dependencies, extract only the package name (before the colon)
-                            # Format: "package: description" or just "package"
-                            if ':' in line:
-                                package_name = line.split(':')[0].strip()
-                                # Remove quotes if present
-                                package_name = package_name.strip('\'"')
-                                if package_name:
-                                    deps.append(package_name)
-                            else:
-                                # No description, just package name
-                                package_name = line.strip('\'"')
-                                if package_name:
-                                    deps.append(package_name)
-                        else:
-                            # For regular dependencies, split by spaces and clean up
-                            dep_list = re.findall(r"'([^']+)'|\"([^\"]+)\"|(\S+)", line)
-                            for dep in dep_list:
-                                dep_name = dep[0] or dep[1] or dep[2]
-                                if dep_name:
-                                    deps.append(dep_name)
-            dependencies[dep_type] = deps
+    # Extract all dependency arrays in a single pass over the file
+    for match in DEP_ARRAY_RE.finditer(content):
+        dep_type, array = match.groups()
+        deps = dependencies[dep_type.decode()]
+        # Split by newlines and clean up
+        for line in array.split(b'\n'):
+            line = line.strip()
+            if line and not line.startswith(b'#'):
+                if dep_type == b'optdepends':
+                    # For optional dependencies, extract only the package name (before the colon)
+                    # Format: "package: description" or just "package"
+                    if b':' in line:
+                        package_name = line.split(b':')[0].strip()
+                        # Remove quotes if present
+                        package_name = package_name.strip(b'\'"')
+                        if package_name:
+                            deps.append(package_name.decode('utf-8', 'replace'))
+                    else:
+                        # No description, just package name
+                        package_name = line.strip(b'\'"')
+                        if package_name:
+                            deps.append(package_name.decode('utf-8', 'replace'))
+                else:
+                    # For regular dependencies, split by spaces and clean up
+                    dep_list = DEP_TOKEN_RE.findall(line)
+                    for dep in dep_list:
+                        dep_name = dep[0] or dep[1] or dep[2]
+                        if dep_name:
+                            deps.append(dep_name.decode('utf-8', 'replace'))
     
     return dependencies
 
@@ -618,7 +1099,8 @@ def parse_pkgbuild_version(pkgbuild_path):
         pkgbuild_path: Path to the PKGBUILD file
         
     Returns:
-        Version string from pkgver variable, or '0' if not found
+        Version string as [epoch:]pkgver-pkgrel, like in package filenames,
+        or '0' if pkgver is not found
     """
     if not os.path.exists(pkgbuild_path):
         return '0'
@@ -629,12 +1111,18 @@ def parse_pkgbuild_version(pkgbuild_path):
         
         # Extract pkgver using regex
         # Match: pkgver=value or pkgver='value' or pkgver="value"
-        match = re.search(r'^pkgver=[\'\"]?([^\'\"\n]+)[\'\"]?', content, re.MULTILINE)
-        if match:
-            version = match.group(1).strip()
-            return version
+        match = PKGVER_RE.search(content)
+        if not match:
+            return '0'
+        version = match.group(1).strip()
         
-        return '0'
+        # Add pkgrel and epoch, so the version compares correctly with built package filenames
+        pkgrel = PKGREL_RE.search(content)
+        version = f"{version}-{pkgrel.group(1).strip() if pkgrel else '1'}"
+        epoch = EPOCH_RE.search(content)
+        if epoch and epoch.group(1).strip() not in ('', '0'):
+            version = f"{epoch.group(1).strip()}:{version}"
+        return version
     except Exception as e:
         print(f"Error parsing PKGBUILD for version: {e}")
         return '0'
@@ -650,23 +1138,20 @@ def get_git_package_version(git_url, package_name, debug=False):
     Returns:
         Version string from the PKGBUILD, or '0' if not found
     """
-    # Ensure we're in the root directory
-    ensure_root_directory()
-    
     temp_dir = None
     try:
         # Create a temporary directory for cloning
-        temp_dir = f".git_version_check_{package_name}"
+        temp_dir = os.path.join(get_build_directory(), f".git_version_check_{package_name}")
         
         # Remove existing directory if it exists
         if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
+            remove_directory(temp_dir)
         
         # Clone the repository
-        clone_cmd = f"git clone --depth 1 {git_url} {temp_dir}"
+        clone_cmd = ["git", "clone", "--depth=1", "--single-branch", git_url, temp_dir]
         if debug:
             print(f"Cloning {git_url} to check version...")
-        run_command(clone_cmd, check=False, debug=debug)
+        run_command(clone_cmd, check=False, debug=debug, env=GIT_CLONE_ENV, discard_stdout=True)
         
         # Parse the PKGBUILD
         pkgbuild_path = os.path.join(temp_dir, "PKGBUILD")
@@ -685,11 +1170,15 @@ def get_git_package_version(git_url, package_name, debug=False):
         # Clean up temporary directory
         if temp_dir and os.path.exists(temp_dir):
             try:
-                shutil.rmtree(temp_dir)
+                remove_directory(temp_dir)
             except Exception as e:
                 if debug:
                     print(f"Warning: Failed to clean up {temp_dir}: {e}")
 
+def strip_version_constraint(dependency):
+    """Get the package name of a dependency, e.g. "foo>=1.2" -> "foo"."""
+    return DEP_CONSTRAINT_RE.split(dependency, maxsplit=1)[0]
+
 def analyze_dependency_status(dependencies):
     """Analyze dependencies and categorize them by availability."""
     analysis = {
@@ -706,20 +1195,68 @@ def analyze_dependency_status(dependencies):
     
     analysis['total_count'] = len(all_deps)
     
+    # Packages listed in several arrays (e.g. depends and makedepends) are handled once
+    all_deps = list(dict.fromkeys(dep.strip() for dep in all_deps if dep.strip()))
+    
+    # Look up package names without version constraints; official repos take precedence
+    dep_names = {dep: strip_version_constraint(dep) for dep in all_deps}
+    official = get_official_repo_packages(dep_names.values())
+    aur_infos = get_aur_package_infos(name for name in dep_names.values() if name not in official)
+    
     for dep in all_deps:
-        dep = dep.strip()
-        if not dep:
-            continue
-            
-        if is_package_in_official_repos(dep):
+        dep_name = dep_names[dep]
+        if dep_name in official:
+            # pacman accepts the constraint, so keep it
             analysis['official_repos'].append(dep)
-        elif is_package_in_aur(dep):
-            analysis['aur_packages'].append(dep)
+        elif dep_name in aur_infos:
+            analysis['aur_packages'].append(dep_name)
         else:
             analysis['not_found'].append(dep)
     
     return analysis
 
+def is_package_installed(package_name):
+    """Check if a package is installed, using pyalpm if available, otherwise `pacman -Q`.
+    
+    Packages this run installed itself are known to be installed without asking pacman.
+    """
+    if package_name in installed_packages:
+        return True
+    
+    if pyalpm:
+        try:
+            # Use a fresh handle so packages installed earlier in this run are seen
+            return pyalpm.Handle("/", PACMAN_DB_PATH).get_localdb().get_pkg(package_name) is not None
+        except pyalpm.error as e:
+            print(f"Warning: Could not read the local database with pyalpm, falling back to pacman: {e}")
+    
+    result = run_process(["pacman", "-Q", package_name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return result.returncode == 0
+
+def get_missing_packages(package_names):
+    """Find which of the given dependencies aren't installed yet.
+    
+    Uses a single `pacman -T`, which prints only the unsatisfied dependencies.
+    
+    Args:
+        package_names: List of dependencies, optionally with version constraints
+        
+    Returns:
+        List of the dependencies that aren't satisfied, in the given order
+    """
+    if not package_names:
+        return []
+    
+    result = run_process(["pacman", "-T", *package_names], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode == 0:
+        return []
+    
+    missing = set(result.stdout.split())
+    if result.returncode != 127 or not missing:
+        # pacman failed; assume everything is missing so nothing gets skipped
+        return list(package_names)
+    return [name for name in package_names if name in missing]
+
 def install_aur_package(package_name, visited=None, debug=False):
     """Install an AUR package by cloning and building it with dependency resolution."""
     if visited is None:
@@ -732,46 +1269,55 @@ def install_aur_package(package_name, visited=None, debug=False):
     print(f"Installing AUR package: {package_name}")
     
     # Check if package is already installed
-    stdout, stderr = run_command(f"pacman -Q {package_name}", check=False)
-    if stdout and package_name in stdout:
+    if is_package_installed(package_name):
         print(f"Package {package_name} is already installed")
         return
     
     # Add to visited set to prevent circular dependencies
     visited.add(package_name)
     
-    # Ensure we're in the root directory for AUR package building
-    ensure_root_directory()
-    
     try:
-        # Clone the AUR repository safely
-        safe_clone_aur_package(package_name, debug=debug)
-        
-        # Change to package directory and recursively handle dependencies
-        os.chdir(package_name)
+        # Clone the AUR package and recursively install its dependencies
+        pkg_dir = check_and_install_dependencies(package_name, visited, debug=debug)
         
-        # Check and install dependencies for this AUR package
-        check_and_install_dependencies(package_name, visited, debug=debug)
-        
-        # Build the package
+        # Build the package outside pacman_lock, so parallel builds keep compiling
         print(f"Building AUR package: {package_name}")
-        run_command("makepkg -si --noconfirm", package_name=package_name, debug=debug, capture_output=False)
+        run_command(["makepkg", "-f", "--noconfirm"], cwd=pkg_dir, package_name=package_name, debug=debug, capture_output=False, env=build_env)
+        
+        # Install what was built; pacman only allows one transaction at a time
+        built_files = sorted(glob.glob("*.pkg.tar.zst", root_dir=pkg_dir))
+        with pacman_lock:
+            run_command(["sudo", "pacman", "-U", "--needed", "--noconfirm", *built_files], cwd=pkg_dir, package_name=package_name, debug=debug, capture_output=False)
         
         # Track the package we just installed
         track_package_installation(package_name)
         
-        # Go back to root directory
-        ensure_root_directory()
-        
     except Exception as e:
         print(f"Error building AUR package {package_name}: {e}")
-        # Ensure we go back to root directory even on error
-        ensure_root_directory()
         raise
     finally:
         # Remove from visited set after processing
         visited.discard(package_name)
 
+def clone_aur_packages(package_names, debug=False):
+    """Clone several AUR packages concurrently.
+    
+    Clones are network-bound and independent of each other, so they run in a
+    thread pool. safe_clone_aur_package reuses the clones when the packages
+    are installed afterwards.
+    
+    Args:
+        package_names: List of AUR package names to clone
+        debug: Enable debug output
+    """
+    if len(package_names) < 2:
+        return
+    
+    with ThreadPoolExecutor(max_workers=min(MAX_CLONE_WORKERS, len(package_names))) as executor:
+        futures = [executor.submit(safe_clone_aur_package, name, debug=debug) for name in package_names]
+        for future in futures:
+            future.result()
+
 def check_and_install_dependencies(package_name, visited=None, debug=False, git_url=None):
     """Check and install all dependencies for a package.
     
@@ -780,6 +1326,9 @@ def check_and_install_dependencies(package_name, visited=None, debug=False, git_
         visited: Set of already visited packages (for circular dependency detection)
         debug: Enable debug output
         git_url: Optional git URL. If provided, clone from this URL instead of AUR
+        
+    Returns:
+        Path of the cloned package directory
     """
     if visited is None:
         visited = set()
@@ -788,10 +1337,8 @@ def check_and_install_dependencies(package_name, visited=None, debug=False, git_
     
     try:
         # Clone the package first to get PKGBUILD
-        safe_clone_aur_package(package_name, debug=debug, git_url=git_url)
-        
-        os.chdir(package_name)
-        pkgbuild_path = "PKGBUILD"
+        pkg_dir = safe_clone_aur_package(package_name, debug=debug, git_url=git_url)
+        pkgbuild_path = os.path.join(pkg_dir, "PKGBUILD")
         
         if not os.path.exists(pkgbuild_path):
             error_msg = f"PKGBUILD not found for {package_name}"
@@ -827,29 +1374,43 @@ def check_and_install_dependencies(package_name, visited=None, debug=False, git_
         # Install dependencies
         print(f"\nInstalling dependencies...")
         
+        # Skip dependencies that are already installed
+        missing = set(get_missing_packages(analysis['official_repos'] + analysis['aur_packages'] + analysis['not_found']))
+        official_missing = [dep for dep in analysis['official_repos'] if dep in missing]
+        aur_missing = [dep for dep in analysis['aur_packages'] if dep in missing]
+        unresolved_missing = [dep for dep in analysis['not_found'] if dep in missing]
+        
         # Install from official repos first
-        if analysis['official_repos']:
-            print(f"Installing from official repos: {', '.join(analysis['official_repos'])}")
-            run_command(f"sudo pacman -S --noconfirm {' '.join(analysis['official_repos'])}", package_name=package_name, debug=debug, capture_output=False)
+        if official_missing:
+            print(f"Installing from official repos: {', '.join(official_missing)}")
+            with pacman_lock:
+                run_command(["sudo", "pacman", "-S", "--needed", "--noconfirm", *official_missing], package_name=package_name, debug=debug, capture_output=False)
             # Track the packages we just installed
-            for pkg in analysis['official_repos']:
+            for pkg in official_missing:
                 track_package_installation(pkg)
         
-        # Install AUR packages
-        for dep in analysis['aur_packages']:
+        # Dependencies not found by name may still be provided by a repository package
+        # (e.g. java-runtime); let pacman resolve them, as makepkg -s would
+        if unresolved_missing:
+            print(f"Trying to install unresolved dependencies with pacman: {', '.join(unresolved_missing)}")
+            with pacman_lock:
+                run_command(["sudo", "pacman", "-S", "--needed", "--noconfirm", *unresolved_missing], check=False, debug=debug, capture_output=False)
+            still_missing = set(get_missing_packages(unresolved_missing))
+            for pkg in unresolved_missing:
+                if pkg not in still_missing:
+                    track_package_installation(pkg)
+        
+        # Install AUR packages; their clones can be fetched in parallel, but builds can't
+        clone_aur_packages([dep for dep in aur_missing if dep not in visited], debug=debug)
+        for dep in aur_missing:
             print(f"Installing AUR package: {dep}")
-            # Go back to root directory for AUR package installation
-            ensure_root_directory()
+            # install_aur_package tracks the package itself once it was actually installed
             install_aur_package(dep, visited, debug=debug)
-            # Track the AUR package we just installed
-            track_package_installation(dep)
-            # Return to package directory
-            os.chdir(package_name)
+        
+        return pkg_dir
             
     except Exception as e:
         print(f"Error checking dependencies for {package_name}: {e}")
-        # Ensure we go back to root directory even on error
-        ensure_root_directory()
         raise
 
 
@@ -866,62 +1427,320 @@ def build_package_native(package_name, debug=False, git_url=None):
     else:
         print(f"Building package natively: {package_name}")
     
-    # Set root directory if not already set
-    if root_directory is None:
-        set_root_directory()
-    
     # Ensure packages directory exists
-    os.makedirs("packages", exist_ok=True)
+    packages_dir = os.path.join(get_root_directory(), "packages")
+    os.makedirs(packages_dir, exist_ok=True)
     
     try:
-        # Check and install dependencies
-        check_and_install_dependencies(package_name, debug=debug, git_url=git_url)
+        # Check and install dependencies; only their pacman transactions hold pacman_lock
+        pkg_dir = check_and_install_dependencies(package_name, debug=debug, git_url=git_url)
         
-        # Build the package
+        # Build the package. Dependencies were installed above under pacman_lock, so
+        # makepkg doesn't run pacman itself (-s) and can't collide with other workers.
         print("Building the package...")
-        run_command("makepkg -sf --noconfirm", package_name=package_name, debug=debug, capture_output=False)
+        run_command(["makepkg", "-f", "--noconfirm"], cwd=pkg_dir, package_name=package_name, debug=debug, capture_output=False, env=build_env)
         
         # Copy the built package to the packages directory
         print("Copying built packages to packages/")
-        run_command("cp *.pkg.tar.zst ../packages/", package_name=package_name, debug=debug)
-        
-        # Go back to root directory
-        ensure_root_directory()
+        built_files = glob.glob("*.pkg.tar.zst", root_dir=pkg_dir)
+        if not built_files:
+            error_msg = f"No built package files (*.pkg.tar.zst) found for {package_name}"
+            build_failures.append({
+                'package': package_name,
+                'command': 'copy built packages',
+                'error': error_msg,
+                'timestamp': datetime.now().isoformat()
+            })
+            print(f"BUILD FAILURE for {package_name}: {error_msg}")
+            sys.exit(1)
+        with pacman_lock:
+            for built_file in built_files:
+                shutil.copy(os.path.join(pkg_dir, built_file), packages_dir)
+                pending_repo_packages.append(built_file)
+        refresh_packages_dir()
         
     except Exception as e:
         print(f"Error building package {package_name}: {e}")
-        # Ensure we go back to root directory even on error
-        ensure_root_directory()
         raise
 
+def prefetch_dependency_lookups(packages, aur_infos):
+    """Look up the dependencies of all packages to build in one batch.
+    
+    Dependencies are taken from the AUR metadata of the packages. The results
+    fill the in-process lookup tables, so analyzing each package's dependencies
+    doesn't query pacman or the AUR again for dependencies they share.
+    
+    Packages that are themselves being built are left out, even if an older
+    build of them is in a sync database (e.g. the aurdist repository): they
+    must only be installed once this run has rebuilt them.
+    
+    Args:
+        packages: List of (package_name, git_url) tuples to be built
+        aur_infos: Dict of AUR info (from get_aur_package_infos)
+        
+    Returns:
+        Sorted list of the dependencies available in the official repositories
+    """
+    deps = set()
+    for name, git_url in packages:
+        info = aur_infos.get(name, {}) if git_url is None else {}
+        for key in ('Depends', 'MakeDepends', 'CheckDepends'):
+            deps.update(strip_version_constraint(dep) for dep in info.get(key, []))
+    
+    deps = sorted(deps - {name for name, git_url in packages})
+    official = get_official_repo_packages(deps)
+    get_aur_package_infos(dep for dep in deps if dep not in official)
+    return [dep for dep in deps if dep in official]
+
+def install_official_dependencies(dependencies, debug=False):
+    """Install the official repository dependencies of all packages to build with one pacman call.
+    
+    Installing them up front lets pacman resolve the whole set once, instead of
+    once per package being built. If the combined transaction fails, whatever
+    is still missing is installed per package during its build as before.
+    
+    Args:
+        dependencies: List of dependency names from the official repositories
+        debug: Enable debug output
+    """
+    missing = get_missing_packages(dependencies)
+    if not missing:
+        return
+    
+    print(f"\nInstalling official repo dependencies of all packages: {', '.join(missing)}")
+    run_command(["sudo", "pacman", "-S", "--needed", "--noconfirm", *missing], check=False, debug=debug, capture_output=False)
+    
+    # Track what was actually installed, so cleanup removes it
+    still_missing = set(get_missing_packages(missing))
+    for pkg in missing:
+        if pkg not in still_missing:
+            track_package_installation(pkg)
+
+def get_build_graph(packages, aur_infos):
+    """Get the build-order dependency graph for a set of packages.
+    
+    Dependencies are taken from the AUR metadata (Depends, MakeDepends and
+    CheckDepends). Git URL packages have no AUR metadata, so they only appear
+    as dependencies of other packages.
+    
+    Args:
+        packages: List of (package_name, git_url) tuples to be built
+        aur_infos: Dict of AUR info (from get_aur_package_infos)
+        
+    Returns:
+        Dict mapping each package name to the set of packages from the list it depends on
+    """
+    names = {name for name, git_url in packages}
+    graph = {}
+    for name, git_url in packages:
+        info = aur_infos.get(name, {}) if git_url is None else {}
+        deps = set()
+        for key in ('Depends', 'MakeDepends', 'CheckDepends'):
+            for dep in info.get(key, []):
+                dep_name = strip_version_constraint(dep)
+                if dep_name in names and dep_name != name:
+                    deps.add(dep_name)
+        graph[name] = deps
+    
+    try:
+        graphlib.TopologicalSorter(graph).prepare()
+    except graphlib.CycleError as e:
+        print(f"Warning: Circular dependency between packages to build ({' -> '.join(e.args[1])}), ignoring build order")
+        return {name: set() for name in graph}
+    
+    return graph
+
+def sort_by_build_graph(packages, graph):
+    """Order (package_name, git_url) tuples so that dependencies come before the packages that need them."""
+    git_urls = dict(packages)
+    return [(name, git_urls[name]) for name in graphlib.TopologicalSorter(graph).static_order()]
+
+def build_package_worker(package_name, git_url, debug=False, shared_build_directory=None):
+    """Build a package in a worker process of build_packages_concurrently.
+    
+    The global tracking state of a worker process is not shared with the main
+    process, so it is returned for the caller to merge. Each build clones into
+    its own subdirectory of the run's build directory, since builds running at
+    the same time may need the same AUR dependency.
+    
+    Args:
+        package_name: Name of the package to build
+        git_url: Optional git URL to build from instead of the AUR
+        debug: Enable debug output
+        shared_build_directory: Build directory of the main process
+        
+    Returns:
+        Dict with 'success', 'exit_code' (set if the build called sys.exit),
+        'build_failures', 'installed_packages', 'cloned_directories' and
+        'pending_repo_packages'
+    """
+    global build_directory
+    build_directory = tempfile.mkdtemp(prefix=f"{package_name}-", dir=shared_build_directory or get_build_directory())
+    
+    # Don't reuse connections inherited from the parent process
+    aur_session.close()
+    build_failures.clear()
+    installed_packages.clear()
+    cloned_directories.clear()
+    pending_repo_packages.clear()
+    # Pool workers outlive the builds they run; pick up packages synced since
+    refresh_repo_lookups()
+    
+    success = False
+    exit_code = None
+    try:
+        build_package_native(package_name, debug=debug, git_url=git_url)
+        success = True
+    except SystemExit as e:
+        exit_code = e.code
+    except Exception as e:
+        print(f"Failed to build {package_name}: {e}")
+    
+    return {
+        'success': success,
+        'exit_code': exit_code,
+        'build_failures': list(build_failures),
+        'installed_packages': set(installed_packages),
+        'cloned_directories': set(cloned_directories),
+        'pending_repo_packages': list(pending_repo_packages)
+    }
+
+def build_packages_concurrently(packages, graph, jobs, exclusive_builds=(), max_load=None, debug=False):
+    """Build packages in parallel worker processes, respecting the build-order graph.
+    
+    A package is started once every package it depends on has finished. Packages
+    in exclusive_builds are only built while no other build is running. Like
+    make's -l option, no additional build is started while the system load
+    average is at or above max_load.
+    
+    Args:
+        packages: List of (package_name, git_url) tuples to build
+        graph: Build-order graph from get_build_graph
+        jobs: Maximum number of packages built at the same time
+        exclusive_builds: Names of packages that must be built on their own
+        max_load: Optional load average limit for starting additional builds
+        debug: Enable debug output
+    """
+    git_urls = dict(packages)
+    sorter = graphlib.TopologicalSorter(graph)
+    sorter.prepare()
+    
+    ready = []
+    running = {}
+    # Workers are forked so they inherit the root directory and pacman_lock
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("fork")) as executor:
+        while sorter.is_active():
+            ready.extend(sorter.get_ready())
+            
+            # Start ready packages in order; an exclusive build waits for an empty pool and blocks the queue while it runs
+            while ready and len(running) < jobs:
+                package_name = ready[0]
+                if running and (package_name in exclusive_builds or any(name in exclusive_builds for name in running.values())):
+                    break
+                if running and max_load is not None and os.getloadavg()[0] >= max_load:
+                    break
+                ready.pop(0)
+                print(f"\n{'='*20} Building {package_name} {'='*20}")
+                future = executor.submit(build_package_worker, package_name, git_urls[package_name], debug, get_build_directory())
+                running[future] = package_name
+            
+            # While builds are held back by the load limit, check the load again
+            # periodically instead of only when a running build finishes, like make -l
+            timeout = LOAD_CHECK_INTERVAL if ready and max_load is not None else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                package_name = running.pop(future)
+                result = future.result()
+                
+                # Packages were added by the worker process
+                refresh_packages_dir()
+                build_failures.extend(result['build_failures'])
+                installed_packages.update(result['installed_packages'])
+                cloned_directories.update(result['cloned_directories'])
+                pending_repo_packages.extend(result['pending_repo_packages'])
+                
+                if result['exit_code'] is not None:
+                    sys.exit(result['exit_code'])
+                
+                if result['success']:
+                    # Sync after each package for recursive dependencies
+                    with pacman_lock:
+                        sync_single_package(package_name)
+                
+                sorter.done(package_name)
+
 def update_repository():
-    """Update the pacman repository database."""
-    packages_dir = Path("packages")
+    """Update the pacman repository database.
+    
+    Only packages built during this run are added, replacing (and deleting) older
+    versions of the same packages. If the database doesn't exist yet, all package
+    files in packages/ are added.
+    
+    Returns:
+        List of the package filenames added to the database
+    """
+    packages_dir = Path(get_root_directory()) / "packages"
     if not packages_dir.exists():
         print("No packages directory found")
-        return
+        return []
     
     print("Updating repository database...")
-    # Store current directory
-    original_cwd = os.getcwd()
     
-    try:
-        os.chdir("packages")
-        
+    if (packages_dir / "aurdist.db.tar.zst").exists():
+        pkg_files = sorted(set(pending_repo_packages))
+    else:
         # Find all package files
-        pkg_files = list(Path(".").glob("*.pkg.tar.zst"))
-        
-        if not pkg_files:
-            print("No package files found")
-            return
-        
-        # Update the repository database
-        run_command("repo-add -vn aurdist.db.tar.zst *.pkg.tar.zst")
+        pkg_files = sorted(scan_packages_dir())
+    
+    if not pkg_files:
+        print("No new package files to add")
+        return []
+    
+    # Update the repository database. repo-add fails outright if another run holds the
+    # database lock, so wait for concurrent aurutil runs (e.g. cron) to finish first.
+    with open(os.path.join(get_root_directory(), ".repo-add.lock"), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        run_command(["repo-add", "-v", "-n", "-R", "aurdist.db.tar.zst", *pkg_files], cwd=packages_dir, discard_stdout=True)
+    
+    pending_repo_packages.clear()
+    # -R removed the files of replaced package versions
+    refresh_packages_dir()
+    
+    print("Repository database updated")
+    return pkg_files
+
+def build_rsync_command(remote_path, ssh_config, files_from=None):
+    """Build the rsync command that syncs packages/ to remote_path.
+    
+    Files are compared by size and modification time instead of checksumming
+    every package on both sides. Remote (host:path) destinations are compressed
+    over SSH; local destinations hard-link unchanged files from packages/
+    instead of copying them.
+    
+    Args:
+        remote_path: rsync destination, either host:path or a local path
+        ssh_config: SSH configuration from load_ssh_config
+        files_from: Optional path of a file listing the files in packages/ to
+            sync; without it the whole directory is synced
         
-        print("Repository database updated")
-    finally:
-        # Always return to original directory
-        os.chdir(original_cwd)
+    Returns:
+        rsync argv list
+    """
+    # Interrupted transfers are resumed from a hidden directory, so clients never see partial packages
+    command = ["rsync", "-av", "--partial-dir=.rsync-partial"]
+    
+    # Like rsync itself, treat the destination as remote if a ':' comes before any '/'
+    if ':' in remote_path.split('/', 1)[0]:
+        ssh_args = build_ssh_command_args(ssh_config) or ['-o', 'StrictHostKeyChecking=no']
+        command.extend(["-z", "-e", shlex.join(["ssh", *ssh_args])])
+    else:
+        command.append(f"--link-dest={os.path.join(get_root_directory(), 'packages')}")
+    
+    if files_from:
+        command.append(f"--files-from={files_from}")
+    
+    command.extend(["packages/", remote_path])
+    return command
 
 def sync_packages():
     """Sync packages to remote location if .where file exists."""
@@ -938,13 +1757,11 @@ def sync_packages():
             if ssh_config.get('user'):
                 remote_path = ssh_config['user']
             
-            print(f"Syncing packages to {remote_path}")
+            start_ssh_master(remote_path)
             
-            # Build SSH command with configuration for rsync
-            ssh_args = build_ssh_command_args(ssh_config)
-            ssh_args_str = ' '.join(ssh_args) if ssh_args else '-o StrictHostKeyChecking=no'
+            print(f"Syncing packages to {remote_path}")
             
-            run_command(f"rsync -avc -e 'ssh {ssh_args_str}' packages/ {remote_path}")
+            run_command(build_rsync_command(remote_path, ssh_config), discard_stdout=True)
             print("Packages synced successfully")
 
 def sync_single_package(package_name):
@@ -962,19 +1779,23 @@ def sync_single_package(package_name):
             if ssh_config.get('user'):
                 remote_path = ssh_config['user']
             
-            print(f"Syncing {package_name} to {remote_path} for recursive dependency support")
-            # Update repository database first
-            update_repository()
+            start_ssh_master(remote_path)
             
-            # Build SSH command with configuration for rsync
-            ssh_args = build_ssh_command_args(ssh_config)
-            ssh_args_str = ' '.join(ssh_args) if ssh_args else '-o StrictHostKeyChecking=no'
+            print(f"Syncing {package_name} to {remote_path} for recursive dependency support")
+            # Update repository database first; if it was just created, it lists every package in packages/
+            new_files = update_repository()
             
-            # Then sync
-            run_command(f"rsync -avc -e 'ssh {ssh_args_str}' packages/ {remote_path}")
+            # Then sync only the new packages and the repository database, instead of rescanning all of packages/
+            packages_dir = os.path.join(get_root_directory(), "packages")
+            repo_files = sorted(name for name in os.listdir(packages_dir) if name.startswith(("aurdist.db", "aurdist.files")))
+            with tempfile.NamedTemporaryFile('w', dir=get_build_directory(), prefix="sync-", suffix=".txt") as files_from:
+                files_from.write(''.join(f"{name}\n" for name in new_files + repo_files))
+                files_from.flush()
+                run_command(build_rsync_command(remote_path, ssh_config, files_from=files_from.name), discard_stdout=True)
             print(f"Package {package_name} synced successfully")
             # Update pacman database to make the package available immediately
-            run_command("sudo pacman -Sy", check=False)
+            run_command(["sudo", "pacman", "-Sy"], check=False, discard_stdout=True)
+            refresh_repo_lookups()
 
 def get_packages_from_targets():
     """Get list of packages from targets.txt file.
@@ -1003,21 +1824,9 @@ def get_packages_from_targets():
 
 def get_existing_packages():
     """Get list of packages that already exist in packages/ directory."""
-    packages_dir = Path("packages")
-    if not packages_dir.exists():
-        return []
-    
-    packages = set()
-    for pkg_file in packages_dir.glob("*.pkg.tar.zst"):
-        # Extract package name from filename
-        # Pattern: package-name-version-release-arch.pkg.tar.zst
-        match = re.match(r"([^-]+(?:-[^-]+)*)-[^-]+-[^-]+-[^-]+\.pkg\.tar\.zst", pkg_file.name)
-        if match:
-            packages.add(match.group(1))
-    
-    return list(packages)
+    return list(local_package_index())
 
-def check_package_outdated(package_name, remote_dest=None, is_git_package=False, git_url=None, debug=False):
+def check_package_outdated(package_name, remote_dest=None, is_git_package=False, git_url=None, debug=False, aur_infos=None):
     """Check if a package is outdated compared to AUR or git repository.
     
     Args:
@@ -1026,6 +1835,8 @@ def check_package_outdated(package_name, remote_dest=None, is_git_package=False,
         is_git_package: True if this is a git URL package (skips AUR version check)
         git_url: Git URL for version checking (only used when is_git_package=True)
         debug: Enable debug output
+        aur_infos: Optional dict of prefetched AUR info (from get_aur_package_infos).
+            If provided, the AUR is not queried for this package.
     """
     # For git URL packages, check version from git repository PKGBUILD
     if is_git_package:
@@ -1049,14 +1860,19 @@ def check_package_outdated(package_name, remote_dest=None, is_git_package=False,
         if git_version == '0':
             return False, f"Git package found {location_desc} (Version: {local_version}, Git version unknown)"
         
-        # Compare versions
-        if git_version != local_version:
+        # Compare full [epoch:]pkgver-pkgrel versions. Only the committed pkgver counts:
+        # -git packages whose pkgver() derives it from upstream commits are only rebuilt
+        # once the pkgver in the PKGBUILD (or pkgrel/epoch) moves.
+        if vercmp(local_version, git_version) < 0:
             return True, f"Outdated (Local: {local_version}, Git: {git_version})"
         else:
             return False, f"Up to date (Version: {local_version})"
     
     # For AUR packages, check version
-    aur_version = get_aur_version(package_name)
+    if aur_infos is not None:
+        aur_version = aur_infos.get(package_name, {}).get('Version', '0')
+    else:
+        aur_version = get_aur_version(package_name)
     
     # Use remote version checking if remote_dest is specified, otherwise use local
     if remote_dest:
@@ -1072,8 +1888,8 @@ def check_package_outdated(package_name, remote_dest=None, is_git_package=False,
     if aur_version == '0':
         return False, f"Package not found in AUR (Local: {local_version})"
     
-    # Simple version comparison (this could be improved with proper semver parsing)
-    if aur_version != local_version:
+    # Only rebuild when the AUR version is actually newer
+    if vercmp(local_version, aur_version) < 0:
         return True, f"Outdated (Local: {local_version}, AUR: {aur_version})"
     
     return False, f"Up to date (Version: {local_version})"
@@ -1083,10 +1899,14 @@ def main():
     parser.add_argument('package', nargs='?', help='Package name or git URL to build (supports AUR packages, HTTP/HTTPS URLs, and SSH URLs)')
     parser.add_argument('-f', '--force', action='store_true', help='Force build even if up to date')
     parser.add_argument('--check-only', action='store_true', help='Only check versions, don\'t build')
+    parser.add_argument('--refresh', action='store_true', help='Ignore the AUR lookup cache and query the AUR again')
     parser.add_argument('--debug', action='store_true', help='Show detailed output from makepkg and pacman commands (useful for manual debugging)')
     parser.add_argument('--no-cleanup', action='store_true', help='Don\'t clean up packages installed during build process')
     parser.add_argument('--cleanup-only', action='store_true', help='Only clean up tracked packages and exit')
     parser.add_argument('--remote-dest', type=str, help='SSH destination to check for existing packages (user@host:path)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of outdated packages to build in parallel (default: 1)')
+    parser.add_argument('-l', '--load-average', type=float, metavar='LOAD', help='With --jobs, don\'t start another build while the load average is at least LOAD (like make -l)')
+    parser.add_argument('--exclusive-build', action='append', default=[], metavar='PACKAGE', help='Never build this package in parallel with others (can be given multiple times)')
     
     args = parser.parse_args()
     
@@ -1102,15 +1922,26 @@ def main():
         print(f"Remote destination mode enabled: {args.remote_dest}")
         print("Package versions will be checked against remote SSH destination")
         print("=" * 50)
+        start_ssh_master(args.remote_dest)
     
     # Set root directory for AUR package building
     set_root_directory()
     
+    # Builds running in parallel share the CPUs
+    set_build_parallelism(1 if args.package else args.jobs)
+    
+    # Forced builds and --refresh use fresh AUR info rather than cached lookups
+    if args.force or args.refresh:
+        disable_aur_cache()
+    
     # Handle cleanup-only mode
     if args.cleanup_only:
         manual_cleanup()
         return
     
+    # Create the build directory before any worker threads or processes need it
+    get_build_directory()
+    
     try:
         if args.package:
             # Build specific package
@@ -1164,12 +1995,28 @@ def main():
             
             print(f"Found {len(target_packages)} packages to check")
             
+            # Fetch AUR info for all AUR targets in a single request
+            aur_infos = get_aur_package_infos(name for name, git_url in target_packages if git_url is None)
+            
+            def check_target(target):
+                package_name, git_url = target
+                is_git_package = git_url is not None
+                return check_package_outdated(package_name, args.remote_dest, is_git_package=is_git_package, git_url=git_url, debug=args.debug, aur_infos=aur_infos)
+            
+            # Index packages/ (or the remote destination) once up front so the checks share one scan
+            if args.remote_dest:
+                remote_package_index(args.remote_dest)
+            else:
+                local_package_index()
+            
+            # Checks are I/O-bound, so run them concurrently and report in input order
+            with ThreadPoolExecutor(max_workers=min(MAX_CHECK_WORKERS, len(target_packages))) as executor:
+                results = list(executor.map(check_target, target_packages))
+            
             packages_to_build = []
             
-            for package_name, git_url in target_packages:
+            for (package_name, git_url), (is_outdated, status) in zip(target_packages, results):
                 print(f"\nChecking {package_name}...")
-                is_git_package = git_url is not None
-                is_outdated, status = check_package_outdated(package_name, args.remote_dest, is_git_package=is_git_package, git_url=git_url, debug=args.debug)
                 print(f"  {status}")
                 
                 if is_outdated or args.force:
@@ -1177,15 +2024,26 @@ def main():
             
             if packages_to_build:
                 print(f"\nBuilding {len(packages_to_build)} outdated packages...")
-                for package_name, git_url in packages_to_build:
-                    print(f"\n{'='*20} Building {package_name} {'='*20}")
-                    try:
-                        build_package_native(package_name, debug=args.debug, git_url=git_url)
-                        # Sync after each package for recursive dependencies
-                        sync_single_package(package_name)
-                    except Exception as e:
-                        print(f"Failed to build {package_name}: {e}")
-                        # Continue with next package instead of exiting
+                
+                # Look up the dependencies of all packages at once, and install the official ones together
+                official_dependencies = prefetch_dependency_lookups(packages_to_build, aur_infos)
+                install_official_dependencies(official_dependencies, debug=args.debug)
+                
+                # Build packages that other targets depend on first
+                build_graph = get_build_graph(packages_to_build, aur_infos)
+                
+                if args.jobs > 1:
+                    build_packages_concurrently(packages_to_build, build_graph, args.jobs, exclusive_builds=set(args.exclusive_build), max_load=args.load_average, debug=args.debug)
+                else:
+                    for package_name, git_url in sort_by_build_graph(packages_to_build, build_graph):
+                        print(f"\n{'='*20} Building {package_name} {'='*20}")
+                        try:
+                            build_package_native(package_name, debug=args.debug, git_url=git_url)
+                            # Sync after each package for recursive dependencies
+                            sync_single_package(package_name)
+                        except Exception as e:
+                            print(f"Failed to build {package_name}: {e}")
+                            # Continue with next package instead of exiting
                 
                 # Update repository and sync
                 update_repository()